@@ -1,18 +1,23 @@
 import streamlit as st
 import os
+import sys
 from dotenv import load_dotenv
-import google.generativeai as genai
 
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
 from langchain_community.vectorstores import FAISS
 from langchain.chains import ConversationalRetrievalChain
 from langchain.memory import ConversationBufferMemory
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import gemini_client, tracing
+from common.chat_log import restore_memory
+from common.chat_session import open_chat_log, reset_chat_log, visible_messages
+from common.debug_panel import keep_last_request, render_debug_panel
+
 # Load environment variables
 load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+trace_request = tracing.begin("pdf_qa")
 
 # Streamlit Page Config
 st.set_page_config(page_title="PDF-BOT Q&A", page_icon="📄", layout="centered")
@@ -24,6 +29,17 @@ if "welcomed" not in st.session_state:
     st.session_state.welcomed = True
     st.info("👋 Hello! Upload 1 or more PDFs and ask me anything!")
 
+# Chat history lives in an append-only log on disk; ?session=<id> reopens it
+chat_log = open_chat_log()
+
+# Memory Setup
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationBufferMemory(
+        memory_key="chat_history", return_messages=True, output_key="answer"
+    )
+    # Reopened session: rebuild memory from the log, no LLM calls replayed
+    restore_memory(chat_log, st.session_state.memory)
+
 # Upload Multiple PDFs
 pdf_files = st.file_uploader("📄 Upload your PDFs", type=["pdf"], accept_multiple_files=True)
 
@@ -51,11 +67,14 @@ if pdf_files:
             with open(pdf.name, "wb") as f:
                 f.write(pdf.read())
 
-            loader = PyPDFLoader(pdf.name)
-            pages = loader.load()
+            with tracing.trace("pdf.parse", bytes_in=pdf.size) as span:
+                loader = PyPDFLoader(pdf.name)
+                pages = loader.load()
+                span.bytes_out = sum(len(page.page_content.encode("utf-8")) for page in pages)
 
-            splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            docs = splitter.split_documents(pages)
+            with tracing.trace("split"):
+                splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+                docs = splitter.split_documents(pages)
 
             # Add filename as source
             for doc in docs:
@@ -64,18 +83,18 @@ if pdf_files:
             all_docs.extend(docs)
 
         # Create Vector Store
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-        vectorstore = FAISS.from_documents(all_docs, embeddings)
-
-        # Gemini Chat Model
-        llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0.3)
-
-        # Memory Setup
-        if "memory" not in st.session_state:
-            st.session_state.memory = ConversationBufferMemory(
-                memory_key="chat_history", return_messages=True, output_key="answer"
+        embeddings = gemini_client.get_embeddings()
+        texts = [doc.page_content for doc in all_docs]
+        with tracing.trace("embed", bytes_in=sum(len(t.encode("utf-8")) for t in texts)):
+            vectors = embeddings.embed_documents(texts)
+        with tracing.trace("faiss.build"):
+            vectorstore = FAISS.from_embeddings(
+                list(zip(texts, vectors)), embeddings, metadatas=[doc.metadata for doc in all_docs]
             )
 
+        # Gemini Chat Model (cached for the whole process)
+        llm = gemini_client.get_chat_model()
+
         # QA Chain
         qa_chain = ConversationalRetrievalChain.from_llm(
             llm=llm,
@@ -85,62 +104,61 @@ if pdf_files:
             output_key="answer"
         )
 
-        # Chat History
-        if "chat" not in st.session_state:
-            st.session_state.chat = []
-
         # Chat Input
         query = st.chat_input("Ask your PDFs a question...")
 
         if query:
-            st.session_state.chat.append(("user", query))
+            chat_log.append("user", query)
 
             # Handle small talk
             small_talk_response = handle_small_talk(query)
+            memory_answer = None
             if small_talk_response:
                 answer = small_talk_response
             else:
                 with st.spinner("🤖 BOT is thinking..."):
-                    result = qa_chain.invoke({"question": query})
-                    answer = result["answer"]
+                    result = qa_chain.invoke(
+                        {"question": query}, config={"callbacks": [tracing.langchain_handler()]}
+                    )
+                    answer = memory_answer = result["answer"]
 
                     # Optional: Source document tracking
                     sources = set([doc.metadata.get("source") for doc in result["source_documents"]])
                     if sources:
                         answer += "\n\n📄 **Source(s)**: " + ", ".join(sources)
 
-            st.session_state.chat.append(("bot", answer))
-
-        # Display Chat History
-        for role, msg in st.session_state.chat:
-            if role == "user":
-                st.markdown(
-                    f"""
-                    <div style='text-align: right; margin: 8px 0;'>
-                        <div style='display: inline-block; background-color: #f0f2f6; color: black;
-                                    padding: 10px 15px; border-radius: 20px; max-width: 75%;'>
-                            🧑‍🎓 {msg}
-                        </div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
+            if memory_answer is None:
+                chat_log.append("bot", answer)
             else:
-                st.markdown(
-                    f"""
-                    <div style='text-align: left; margin: 8px 0;'>
-                        <div style='display: inline-block; background-color: #262730; color: white;
-                                    padding: 10px 15px; border-radius: 20px; max-width: 75%;'>
-                            🤖 {msg}
-                        </div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
+                chat_log.append("bot", answer, memory=memory_answer)
+            keep_last_request(trace_request)
+
+# Display Chat History: only the recent window, as a single HTML block.
+# Outside the PDF block so a reopened session shows its history right away.
+bubbles = []
+for message in visible_messages(chat_log):
+    if message["role"] == "user":
+        bubbles.append(
+            "<div style='text-align: right; margin: 8px 0;'>"
+            "<div style='display: inline-block; background-color: #f0f2f6; color: black; "
+            "padding: 10px 15px; border-radius: 20px; max-width: 75%;'>"
+            f"🧑‍🎓 {message['content']}</div></div>"
+        )
+    else:
+        bubbles.append(
+            "<div style='text-align: left; margin: 8px 0;'>"
+            "<div style='display: inline-block; background-color: #262730; color: white; "
+            "padding: 10px 15px; border-radius: 20px; max-width: 75%;'>"
+            f"🤖 {message['content']}</div></div>"
+        )
+st.markdown("\n".join(bubbles), unsafe_allow_html=True)
 
 # Optional: Reset button
 st.markdown("---")
 if st.button("🔁 Reset Chat"):
-    st.session_state.chat = []
-    st.session_state.memory.clear()
+    reset_chat_log()
+    if "memory" in st.session_state:
+        st.session_state.memory.clear()
     st.success("Chat history cleared!")
+
+render_debug_panel()
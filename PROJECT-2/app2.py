@@ -1,5 +1,6 @@
 import streamlit as st
 import os
+import sys
 import time
 import platform
 import re
@@ -8,17 +9,21 @@ import pyttsx3
 import threading
 from dotenv import load_dotenv
 
-import google.generativeai as genai
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
 from langchain_community.vectorstores import FAISS
 from langchain.chains import ConversationalRetrievalChain
 from langchain.memory import ConversationBufferMemory
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import gemini_client, tracing
+from common.chat_log import restore_memory
+from common.chat_session import open_chat_log, reset_chat_log, visible_messages
+from common.debug_panel import keep_last_request, render_debug_panel
+
 # Load environment variables
 load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+trace_request = tracing.begin("voice_pdf_qa")
 
 st.set_page_config(page_title="📄 PDF Voice Assistant", layout="centered")
 st.markdown("<h2 style='text-align: center;'>🎙️ Voice-Enabled AI PDF Chatbot</h2>", unsafe_allow_html=True)
@@ -38,15 +43,16 @@ def clean_for_tts(text):
 def speak_text_async(text):
     def run_tts():
         try:
-            engine = pyttsx3.init()
-            engine.setProperty('rate', 170)
-            engine.setProperty('volume', 1.0)
-            engine.say(text)
-            engine.runAndWait()
-            engine.stop()
+            with tracing.trace("tts.speak", bytes_in=len(text.encode("utf-8"))):
+                engine = pyttsx3.init()
+                engine.setProperty('rate', 170)
+                engine.setProperty('volume', 1.0)
+                engine.say(text)
+                engine.runAndWait()
+                engine.stop()
         except Exception as e:
             st.warning(f"🔊 Text-to-speech error: {e}")
-    threading.Thread(target=run_tts).start()
+    threading.Thread(target=tracing.bind(run_tts)).start()
 
 # 🎤 Voice Input
 
@@ -55,8 +61,11 @@ def get_voice_input():
     with sr.Microphone() as source:
         st.info("🎤 Listening... Please speak.")
         try:
-            audio = recognizer.listen(source, timeout=5)
-            query = recognizer.recognize_google(audio)
+            with tracing.trace("speech.listen"):
+                audio = recognizer.listen(source, timeout=5)
+            with tracing.trace("speech.recognize", bytes_in=len(audio.frame_data)) as span:
+                query = recognizer.recognize_google(audio)
+                span.bytes_out = len(query.encode("utf-8"))
             st.success(f"🗣️ You said: {query}")
             return query
         except sr.UnknownValueError:
@@ -85,14 +94,24 @@ def detect_task(user_input):
 
 # ✨ Prompt Handlers
 
+def ask_llm(llm, prompt):
+    return llm.invoke(prompt, config={"callbacks": [tracing.langchain_handler()]})
+
 def handle_summarization(text, llm):
-    return llm.invoke("Summarize the document with markdown headings:\n\n" + text[:5000])
+    return ask_llm(llm, "Summarize the document with markdown headings:\n\n" + text[:5000])
 
 def handle_bullet_points(text, llm):
-    return llm.invoke("List key points in bullet form:\n\n" + text[:5000])
+    return ask_llm(llm, "List key points in bullet form:\n\n" + text[:5000])
 
 def handle_comparison(text1, text2, llm):
-    return llm.invoke(f"Compare these documents:\n\nDocument 1:\n{text1[:5000]}\n\nDocument 2:\n{text2[:5000]}")
+    return ask_llm(llm, f"Compare these documents:\n\nDocument 1:\n{text1[:5000]}\n\nDocument 2:\n{text2[:5000]}")
+
+# 🗂️ Chat history lives in an append-only log on disk; ?session=<id> reopens it
+chat_log = open_chat_log()
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True, output_key="answer")
+    # Reopened session: rebuild memory from the log, no LLM calls replayed
+    restore_memory(chat_log, st.session_state.memory)
 
 # 📄 Upload PDFs
 pdf_files = st.file_uploader("📄 Upload your PDF files", type=["pdf"], accept_multiple_files=True)
@@ -104,20 +123,26 @@ if pdf_files:
         for pdf in pdf_files:
             with open(pdf.name, "wb") as f:
                 f.write(pdf.read())
-            loader = PyPDFLoader(pdf.name)
-            pages = loader.load()
-            splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            docs = splitter.split_documents(pages)
+            with tracing.trace("pdf.parse", bytes_in=pdf.size) as span:
+                loader = PyPDFLoader(pdf.name)
+                pages = loader.load()
+                span.bytes_out = sum(len(page.page_content.encode("utf-8")) for page in pages)
+            with tracing.trace("split"):
+                splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+                docs = splitter.split_documents(pages)
             for doc in docs:
                 doc.metadata["source"] = pdf.name
             all_docs.extend(docs)
 
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-        vectorstore = FAISS.from_documents(all_docs, embeddings)
-        llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0.3)
-
-        if "memory" not in st.session_state:
-            st.session_state.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True, output_key="answer")
+        embeddings = gemini_client.get_embeddings()
+        texts = [doc.page_content for doc in all_docs]
+        with tracing.trace("embed", bytes_in=sum(len(t.encode("utf-8")) for t in texts)):
+            vectors = embeddings.embed_documents(texts)
+        with tracing.trace("faiss.build"):
+            vectorstore = FAISS.from_embeddings(
+                list(zip(texts, vectors)), embeddings, metadatas=[doc.metadata for doc in all_docs]
+            )
+        llm = gemini_client.get_chat_model()
 
         qa_chain = ConversationalRetrievalChain.from_llm(
             llm=llm,
@@ -127,15 +152,12 @@ if pdf_files:
             output_key="answer"
         )
 
-        if "chat" not in st.session_state:
-            st.session_state.chat = []
-
         # 🎙️ Voice Input
         st.markdown("🎙️ Or ask with your voice")
         if st.button("🎤 Speak Now"):
             voice_query = get_voice_input()
             if voice_query:
-                st.session_state.chat.append(("user", voice_query))
+                chat_log.append("user", voice_query)
                 query = voice_query
             else:
                 query = None
@@ -145,12 +167,13 @@ if pdf_files:
         # 💬 Text Input
         typed_query = st.chat_input("💬 Type your question here...")
         if typed_query:
-            st.session_state.chat.append(("user", typed_query))
+            chat_log.append("user", typed_query)
             query = typed_query
 
         # 🧠 Process Query
         if "query" in locals() and query:
             task_type = detect_task(query)
+            memory_answer = None
             with st.spinner("🤖 Thinking..."):
                 if task_type == "summarize":
                     content = " ".join([doc.page_content for doc in all_docs])
@@ -166,30 +189,39 @@ if pdf_files:
                     else:
                         answer = "⚠️ Please upload at least 2 PDFs to compare."
                 else:
-                    result = qa_chain.invoke({"question": query})
-                    answer = result["answer"]
+                    result = qa_chain.invoke(
+                        {"question": query}, config={"callbacks": [tracing.langchain_handler()]}
+                    )
+                    answer = memory_answer = result["answer"]
                     sources = set([doc.metadata.get("source") for doc in result["source_documents"]])
                     if sources:
                         answer += "\n\n📄 **Source(s)**: " + ", ".join(sources)
 
-            st.session_state.chat.append(("bot", answer))
+            answer = answer.content if hasattr(answer, "content") else answer
+            if memory_answer is None:
+                chat_log.append("bot", answer)
+            else:
+                chat_log.append("bot", answer, memory=memory_answer)
+            keep_last_request(trace_request)
             if voice_enabled:
                 speak_text_async(clean_for_tts(answer))
 
-        # 💬 Show Chat
-        for role, msg in st.session_state.chat:
-            if role == "user":
-                st.markdown(f"<div style='text-align: right; margin: 8px 0;'><div style='display: inline-block; background-color: #f0f2f6; color: black; padding: 10px 15px; border-radius: 20px; max-width: 75%;'>🧑‍🎓 {msg}</div></div>", unsafe_allow_html=True)
-            else:
-                with st.expander("📄 Click to expand response"):
-                    st.markdown(msg.content if hasattr(msg, "content") else msg, unsafe_allow_html=True)
+# 💬 Show Chat (recent window only; older turns load on demand).
+# Outside the PDF block so a reopened session shows its history right away.
+for message in visible_messages(chat_log):
+    if message["role"] == "user":
+        st.markdown(f"<div style='text-align: right; margin: 8px 0;'><div style='display: inline-block; background-color: #f0f2f6; color: black; padding: 10px 15px; border-radius: 20px; max-width: 75%;'>🧑‍🎓 {message['content']}</div></div>", unsafe_allow_html=True)
+    else:
+        st.markdown(message["content"], unsafe_allow_html=True)
 
 # 🔁 Reset Chat
 st.markdown("---")
 if st.button("🔁 Reset Chat"):
-    st.session_state.chat = []
+    reset_chat_log()
     if "memory" in st.session_state:
         st.session_state.memory.clear()
     st.success("✅ Chat history cleared!")
     time.sleep(1)
     st.rerun()
+
+render_debug_panel()
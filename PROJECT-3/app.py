@@ -1,14 +1,23 @@
 import streamlit as st
 import pandas as pd
+import os
+import sys
 import re
 from difflib import get_close_matches
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import tracing
+from common.debug_panel import keep_last_request, render_debug_panel
+
+trace_request = tracing.begin("support_chat")
+
 # Load CSVs
-orders_df = pd.read_csv("orders.csv")
-products_df = pd.read_csv("products.csv")
-faq_df = pd.read_csv("faq.csv")
+with tracing.trace("csv.load"):
+    orders_df = pd.read_csv("orders.csv")
+    products_df = pd.read_csv("products.csv")
+    faq_df = pd.read_csv("faq.csv")
 
 # Initialize chat history and cancelled order memory
 if "chat_history" not in st.session_state:
@@ -23,6 +32,7 @@ def extract_order_id(text):
     match = re.search(r"#?(\d{5})", text)
     return match.group(1) if match else None
 
+@tracing.trace("faq.tfidf")
 def faq_response(query):
     vectorizer = TfidfVectorizer()
     tfidf_matrix = vectorizer.fit_transform(faq_df["question"])
@@ -33,6 +43,7 @@ def faq_response(query):
         return faq_df.iloc[max_idx]["answer"]
     return None
 
+@tracing.trace("product.match")
 def find_closest_product(query):
     all_products = products_df["product_name"].str.lower().tolist()
     match = get_close_matches(query.lower(), all_products, n=1, cutoff=0.5)
@@ -117,4 +128,8 @@ user_input = st.chat_input("Type your message...")
 if user_input:
     response = respond_to_query(user_input)
     st.session_state.chat_history.append((user_input, response))
+    keep_last_request(trace_request)
     st.experimental_rerun()
+
+# Reruns only reload the CSVs, so the panel keeps showing the last answered message
+render_debug_panel()
@@ -2,21 +2,23 @@
 import streamlit as st
 import fitz  # PyMuPDF
 import os
-import google.generativeai as genai
+import sys
 import speech_recognition as sr
 from dotenv import load_dotenv
 import re
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import gemini_client, tracing
+from common.debug_panel import keep_last_request, render_debug_panel
+
 # Load API key
 load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
-# Load Gemini 2.5 Pro
-model = genai.GenerativeModel("gemini-2.5-pro")
+trace_request = tracing.begin("study_assistant")
 
 # ========== UTILS ==========
 @st.cache_data
 def extract_text(file_path):
+    tracing.annotate(cache_hit=False)  # only reached on a cache miss
     doc = fitz.open(file_path)
     return " ".join([page.get_text() for page in doc])
 
@@ -33,8 +35,7 @@ Act as a professional teacher. Summarize the following class notes in simple lan
 
 {chunk}
 """
-        response = model.generate_content(prompt)
-        all.append(response.text)
+        all.append(gemini_client.generate(prompt))
     return "\n".join(all)
 
 def generate_structured_quiz(text):
@@ -49,7 +50,7 @@ Answer: b
 From this content:
 {text}
 """
-    raw = model.generate_content(prompt).text
+    raw = gemini_client.generate(prompt)
 
     pattern = r"Q:\s*(.*?)\n\s*a\)\s*(.*?)\n\s*b\)\s*(.*?)\n\s*c\)\s*(.*?)\n\s*d\)\s*(.*?)\n\s*Answer:\s*([abcd])"
     matches = re.findall(pattern, raw, re.DOTALL)
@@ -73,7 +74,7 @@ From these notes, create 5 flashcards in Q&A format to help students learn:
 
 {text}
 """
-    return model.generate_content(prompt).text
+    return gemini_client.generate(prompt)
 
 def answer_question(text, query):
     prompt = f"""
@@ -85,15 +86,17 @@ Notes:
 Question:
 {query}
 """
-    return model.generate_content(prompt).text
+    return gemini_client.generate(prompt)
 
 def voice_input():
     r = sr.Recognizer()
     with sr.Microphone() as source:
         st.info("🎤 Listening... Speak your question.")
-        audio = r.listen(source)
+        with tracing.trace("speech.listen"):
+            audio = r.listen(source)
     try:
-        return r.recognize_google(audio)
+        with tracing.trace("speech.recognize", bytes_in=len(audio.frame_data)):
+            return r.recognize_google(audio)
     except:
         return "❌ Could not recognize your voice."
 
@@ -112,7 +115,9 @@ if uploaded_file:
     with open(file_path, "wb") as f:
         f.write(uploaded_file.read())
 
-    full_text = extract_text(file_path)
+    with tracing.trace("pdf.parse", bytes_in=os.path.getsize(file_path), cache_hit=True) as span:
+        full_text = extract_text(file_path)
+        span.bytes_out = len(full_text.encode("utf-8"))
     text = " ".join(full_text.split()[:word_limit])
 
     mode = st.selectbox("🧠 Choose Task", ["Summary", "Quiz", "Flashcards"])
@@ -121,6 +126,7 @@ if uploaded_file:
         if st.button("📝 Generate Summary"):
             with st.spinner("Working..."):
                 st.write(summarize(text))
+            keep_last_request(trace_request)
 
     elif mode == "Quiz":
         if st.button("🧠 Generate Interactive Quiz"):
@@ -128,6 +134,7 @@ if uploaded_file:
                 quiz = generate_structured_quiz(text)
                 st.session_state.quiz = quiz
                 st.session_state.submitted = False
+            keep_last_request(trace_request)
 
         if "quiz" in st.session_state:
             quiz = st.session_state.quiz
@@ -164,6 +171,7 @@ if uploaded_file:
         if st.button("📇 Create Flashcards"):
             with st.spinner("Generating..."):
                 st.write(generate_flashcards(text))
+            keep_last_request(trace_request)
 
     st.subheader("💬 Ask a Question")
     q = st.text_input("Type your question here")
@@ -175,6 +183,7 @@ if uploaded_file:
             st.session_state.last_a = a
             st.success("Done")
             st.write(a)
+        keep_last_request(trace_request)
 
     if st.button("🎤 Ask by Voice"):
         with st.spinner("Listening..."):
@@ -185,4 +194,7 @@ if uploaded_file:
             st.session_state.voice_q = voice_q
             st.session_state.voice_a = a
             st.success("Answer ready")
-            st.write(a)
\ No newline at end of file
+            st.write(a)
+        keep_last_request(trace_request)
+
+render_debug_panel()
@@ -1,102 +1,81 @@
 import streamlit as st
 import fitz  # PyMuPDF
 import os
-import pyttsx3
-from pydub import AudioSegment
+import sys
+import queue
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import google.generativeai as genai
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import tracing
+from common.debug_panel import keep_last_request, render_debug_panel
+
+from podcast_audio import PodcastRenderer, read_and_remove
+from podcast_script import (
+    generate_section_script, generate_title_and_summary, generate_title_from_digests, iter_sections, produce_script,
+    stream_podcast_script, stream_sectioned_script,
+)
 
 # Load Gemini API key
 load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel("gemini-2.5-pro")
+trace_request = tracing.begin("podcast")
+
+# Long-document mode: sections (see podcast_script.iter_sections) are scripted in parallel
+SECTION_WORKERS = 4
+LONG_DOC_PAGES = 20
 
 
 # ----------------- Helper Functions -----------------
 
-def extract_text_from_pdf(pdf_file):
-    text = ""
-    with fitz.open(stream=pdf_file.read(), filetype="pdf") as doc:
-        for page in doc:
-            page_text = page.get_text()
+def save_upload(pdf_file, chunk_size=1 << 20):
+    """Copy the upload to a temporary file in chunks so PyMuPDF can load pages lazily."""
+    pdf_file.seek(0)
+    fd, pdf_path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        shutil.copyfileobj(pdf_file, f, chunk_size)
+    return pdf_path
+
+
+def count_pdf_pages(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def iter_pdf_pages(pdf_path, first_page=1, last_page=None):
+    """Yield the text of each readable page in the (1-based, inclusive) page range."""
+    with fitz.open(pdf_path) as doc:
+        last_page = min(last_page or doc.page_count, doc.page_count)
+        for number in range(first_page - 1, last_page):
+            page_text = doc.load_page(number).get_text()
             if len(page_text.strip()) > 20:
-                text += page_text
-    return text.strip()
+                yield page_text
 
 
-def gemini_generate(prompt):
-    try:
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        return f"[ERROR] Gemini failed: {e}"
-
-
-def generate_title_and_summary(text):
-    prompt = f"""
-    You're an AI podcast assistant. Read the content below and generate ONLY:
-    1. A podcast title
-    2. A short episode summary
-
-    Respond in this format:
-    Title: <your title>
-    Summary: <your summary>
-
-    CONTENT:
-    {text}
-    """
-    response = gemini_generate(prompt)
-
-    # Parse output
-    title, summary = "Untitled Podcast", "No summary available."
-    lines = response.splitlines()
-    for line in lines:
-        if "Title:" in line:
-            title = line.replace("Title:", "").strip()
-        elif "Summary:" in line:
-            summary = line.replace("Summary:", "").strip()
-    return title, summary
-
-
-def generate_podcast_script(text):
-    prompt = (
-        "You're an intelligent podcast narrator. Based ONLY on the content below, create a 3-minute script.\n"
-        "If it's a story, retell it naturally. If it's educational or technical, explain the concepts clearly.\n"
-        "Avoid reading code or special characters. Do NOT add extra topics.\n\n"
-        f"CONTENT:\n{text}"
-    )
-    body = gemini_generate(prompt)
-
-    # Optional smart intro based on content type
-    if any(keyword in text.lower() for keyword in ["api", "machine learning", "gemini", "ai", "model", "neural"]):
-        intro = "Welcome to AI Podcast – simplifying the world of technology, one episode at a time.\n\n"
-    else:
-        intro = "Welcome to AI Podcast – where we bring timeless stories and smart ideas to life.\n\n"
+def extract_text_from_pdf(pdf_path, first_page=1, last_page=None):
+    return "".join(iter_pdf_pages(pdf_path, first_page, last_page)).strip()
 
-    outro = "\n\nThanks for listening. Stay inspired with AI Podcast!"
 
-    return intro + body.strip() + outro
+def show_podcast(podcast):
+    st.subheader("🎧 Podcast Title")
+    st.success(podcast["title"])
 
+    st.subheader("📝 Episode Summary")
+    st.info(podcast["summary"])
 
-def text_to_speech(text, output_path="output/podcast.mp3"):
-    if not os.path.exists("output"):
-        os.makedirs("output")
+    st.subheader("🎙️ Podcast Script")
+    for paragraph in podcast["script"].split("\n\n"):
+        st.write(paragraph)
 
-    engine = pyttsx3.init()
+    show_audio(podcast["audio"])
 
-    # Set female voice
-    voices = engine.getProperty('voices')
-    for voice in voices:
-        if "female" in voice.name.lower() or "zira" in voice.name.lower():
-            engine.setProperty('voice', voice.id)
-            break
 
-    engine.save_to_file(text, "output/temp.wav")
-    engine.runAndWait()
+def show_audio(audio_bytes):
+    st.subheader("🎵 Listen to Your Podcast")
+    st.audio(audio_bytes, format="audio/mpeg")
 
-    sound = AudioSegment.from_wav("output/temp.wav")
-    sound.export(output_path, format="mp3")
-    return output_path
+    st.download_button("📥 Download Podcast", audio_bytes, file_name="ai_podcast.mp3", mime="audio/mpeg")
 
 # ----------------- Streamlit App -----------------
 
@@ -107,30 +86,91 @@ st.markdown("Upload any PDF – story, tech, blog, notes – and get a podcast w
 uploaded_file = st.file_uploader("📄 Upload a PDF", type=["pdf"])
 
 if uploaded_file:
-    with st.spinner("📖 Reading your PDF..."):
-        text = extract_text_from_pdf(uploaded_file)
-
-    if not text or len(text.split()) < 30:
+    pdf_path = save_upload(uploaded_file)
+    try:
+        page_count = count_pdf_pages(pdf_path)
+
+        # Nothing is extracted or generated until the user confirms the options
+        with st.form("podcast_options"):
+            first_page, last_page = 1, page_count
+            if page_count > 1:
+                first_page, last_page = st.slider("📑 Pages to include", 1, page_count, (1, page_count))
+            long_mode = st.toggle("📚 Long-document mode (multi-part episode)", value=page_count > LONG_DOC_PAGES)
+            generate = st.form_submit_button("🎙️ Generate Podcast")
+
+        if generate:
+            with st.spinner("📖 Reading your PDF..."), tracing.trace("pdf.parse", bytes_in=uploaded_file.size) as span:
+                pages = iter_pdf_pages(pdf_path, first_page, last_page)
+                sections = list(iter_sections(pages)) if long_mode else [extract_text_from_pdf(pdf_path, first_page, last_page)]
+                span.bytes_out = sum(len(section.encode("utf-8")) for section in sections)
+    finally:
+        os.remove(pdf_path)
+
+    if not generate:
+        # Later reruns (download clicks, debug panel) show the last episode instead of regenerating it
+        podcast = st.session_state.get("podcast")
+        if podcast and podcast["file_id"] == uploaded_file.file_id:
+            show_podcast(podcast)
+
+    elif sum(len(section.split()) for section in sections) < 30:
         st.error("❌ This file doesn't have enough readable content. Please upload a different PDF.")
-        st.stop()
-
-    with st.spinner("🧠 Generating title and summary..."):
-        title, summary = generate_title_and_summary(text)
-
-    st.subheader("🎧 Podcast Title")
-    st.success(title)
-
-    st.subheader("📝 Episode Summary")
-    st.info(summary)
-
-    with st.spinner("🎙️ Writing podcast script..."):
-        script = generate_podcast_script(text)
-
-    with st.spinner("🔊 Converting to female voice..."):
-        audio_path = text_to_speech(script)
 
-    st.subheader("🎵 Listen to Your Podcast")
-    st.audio(audio_path)
-
-    with open(audio_path, "rb") as file:
-        st.download_button("📥 Download Podcast", file, file_name="ai_podcast.mp3", mime="audio/mpeg")
+    else:
+        # Title/summary, script writing and speech synthesis all run at the same time:
+        # paragraphs are voiced as soon as Gemini finishes writing them.
+        display_queue, tts_queue = queue.Queue(), queue.Queue()
+        renderer = PodcastRenderer()
+        try:
+            with ThreadPoolExecutor(max_workers=3) as pool, ThreadPoolExecutor(max_workers=SECTION_WORKERS) as section_pool:
+                if long_mode:
+                    # Map: every section is scripted concurrently; reduce: parts are joined in order
+                    section_futures = [
+                        section_pool.submit(tracing.bind(generate_section_script), section, number, len(sections))
+                        for number, section in enumerate(sections, start=1)
+                    ]
+                    title_future = pool.submit(tracing.bind(generate_title_from_digests), section_futures)
+                    script_paragraphs = stream_sectioned_script(section_futures, sections[0])
+                else:
+                    text = sections[0]
+                    title_future = pool.submit(tracing.bind(generate_title_and_summary), text)
+                    script_paragraphs = stream_podcast_script(text)
+                script_future = pool.submit(tracing.bind(produce_script), script_paragraphs, display_queue, tts_queue)
+                audio_future = pool.submit(tracing.bind(renderer.render_queue), tts_queue)
+
+                with st.spinner("🧠 Generating title and summary..."):
+                    title, summary = title_future.result()
+
+                st.subheader("🎧 Podcast Title")
+                st.success(title)
+
+                st.subheader("📝 Episode Summary")
+                st.info(summary)
+
+                st.subheader("🎙️ Podcast Script")
+                with st.spinner("🎙️ Writing podcast script..."):
+                    for paragraph in iter(display_queue.get, None):
+                        st.write(paragraph)
+                    script = script_future.result()
+
+                with st.spinner("🔊 Converting to female voice..."):
+                    audio_path = audio_future.result()
+        except Exception as e:
+            # Failed Gemini calls surface here instead of being narrated into the episode
+            st.error(f"❌ Podcast generation failed: {e}")
+            if os.path.exists(renderer.output_path):
+                os.remove(renderer.output_path)
+        else:
+            if long_mode:
+                failed = [number for number, future in enumerate(section_futures, start=1) if future.exception()]
+                if failed:
+                    st.warning(f"⚠️ Sections {', '.join(map(str, failed))} could not be scripted and were left out.")
+            audio_bytes = read_and_remove(audio_path)
+            st.session_state.podcast = {
+                "file_id": uploaded_file.file_id, "title": title, "summary": summary, "script": script, "audio": audio_bytes,
+            }
+            show_audio(audio_bytes)
+
+    if generate:
+        keep_last_request(trace_request)
+
+render_debug_panel()
@@ -0,0 +1,229 @@
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import wave
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import tracing
+
+OUTPUT_DIR = "output"
+CACHE_DIR = os.path.join(OUTPUT_DIR, "segments")
+
+# Long paragraphs are split on sentence boundaries so one segment never gets big
+MAX_SEGMENT_CHARS = 600
+
+# Every segment is encoded with identical settings and without ID3/Xing headers,
+# so the MP3 files can simply be appended to each other byte by byte.
+MP3_BITRATE = "96k"
+MP3_PARAMETERS = ["-ac", "1", "-ar", "44100", "-id3v2_version", "0", "-write_xing", "0"]
+
+# Disk limits: job MP3s are deleted once served, anything left behind by an
+# interrupted run is swept after OUTPUT_MAX_AGE; the segment cache is trimmed
+# to CACHE_MAX_BYTES, least recently used first.
+OUTPUT_MAX_AGE = 60 * 60
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+
+# ----------------- TTS Backends -----------------
+
+class Pyttsx3Backend:
+    """Offline voice using pyttsx3 (female voice when the system has one)."""
+
+    name = "pyttsx3-female"
+
+    # pyttsx3 hands out one shared engine per process, so sessions take turns
+    _lock = threading.Lock()
+
+    def synthesize(self, text, wav_path):
+        import pyttsx3
+
+        with self._lock:
+            engine = pyttsx3.init()
+
+            # Set female voice
+            voices = engine.getProperty('voices')
+            for voice in voices:
+                if "female" in voice.name.lower() or "zira" in voice.name.lower():
+                    engine.setProperty('voice', voice.id)
+                    break
+
+            engine.save_to_file(text, wav_path)
+            engine.runAndWait()
+
+
+class SilentBackend:
+    """Stand-in backend for tests: writes silence whose length follows the word count."""
+
+    name = "silent"
+
+    def __init__(self, seconds_per_word=0.3, frame_rate=16000):
+        self.seconds_per_word = seconds_per_word
+        self.frame_rate = frame_rate
+
+    def synthesize(self, text, wav_path):
+        frames = int(len(text.split()) * self.seconds_per_word * self.frame_rate)
+        with wave.open(wav_path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.frame_rate)
+            wav.writeframes(b"\0\0" * frames)
+
+
+def default_backend():
+    if os.getenv("PODCAST_TTS_BACKEND", "").lower() == "silent":
+        return SilentBackend()
+    return Pyttsx3Backend()
+
+
+# ----------------- Segment Rendering -----------------
+
+def split_segments(text, max_chars=MAX_SEGMENT_CHARS):
+    """Split text into sentence groups of at most max_chars (a single long sentence stays whole)."""
+    sentences = re.split(r"(?<=[.!?])\s+", text.strip())
+    segments, current = [], []
+    length = 0
+    for sentence in sentences:
+        if current and length + len(sentence) > max_chars:
+            segments.append(" ".join(current))
+            current, length = [], 0
+        current.append(sentence)
+        length += len(sentence) + 1
+    if current and " ".join(current).strip():
+        segments.append(" ".join(current))
+    return segments
+
+
+def render_segment(text, backend, cache_dir=CACHE_DIR):
+    """Return (mp3_path, cache_hit) for text, synthesizing and encoding it only if not cached."""
+    key = hashlib.sha256(f"{backend.name}\n{text}".encode("utf-8")).hexdigest()
+    mp3_path = os.path.join(cache_dir, f"{key}.mp3")
+    if os.path.exists(mp3_path):
+        try:
+            # Mark as recently used so prune_cache() keeps it
+            os.utime(mp3_path)
+        except FileNotFoundError:
+            return render_segment(text, backend, cache_dir)
+        tracing.finish(tracing.Span("tts.segment", bytes_in=len(text.encode("utf-8")), cache_hit=True))
+        return mp3_path, True
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, wav_path = tempfile.mkstemp(suffix=".wav", dir=cache_dir)
+    os.close(fd)
+    part_path = wav_path[:-len(".wav")] + ".part"
+    try:
+        with tracing.trace("tts.segment", bytes_in=len(text.encode("utf-8"))) as span:
+            backend.synthesize(text, wav_path)
+            span.bytes_out = os.path.getsize(wav_path)
+        from pydub import AudioSegment
+
+        with tracing.trace("mp3.export", bytes_in=os.path.getsize(wav_path)) as span:
+            AudioSegment.from_wav(wav_path).export(
+                part_path, format="mp3", bitrate=MP3_BITRATE, parameters=MP3_PARAMETERS
+            )
+            span.bytes_out = os.path.getsize(part_path)
+        # Atomic rename: concurrent jobs rendering the same text never see half a file
+        os.replace(part_path, mp3_path)
+    finally:
+        for path in (wav_path, part_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return mp3_path, False
+
+
+def sweep_outputs(output_dir=OUTPUT_DIR, cache_dir=CACHE_DIR, max_age=OUTPUT_MAX_AGE):
+    """Delete job MP3s and temp files older than max_age seconds (left by interrupted runs)."""
+    cutoff = time.time() - max_age
+    leftovers = [(output_dir, "podcast_", ".mp3"), (cache_dir, "tmp", ".wav"), (cache_dir, "tmp", ".part")]
+    for directory, prefix, suffix in leftovers:
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if entry.name.startswith(prefix) and entry.name.endswith(suffix):
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+def prune_cache(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """Trim cached segments to max_bytes, dropping the least recently used first."""
+    if not os.path.isdir(cache_dir):
+        return
+    segments = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".mp3"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            segments.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in segments)
+    for _, size, path in sorted(segments):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+class PodcastRenderer:
+    """Appends encoded segments to a per-job MP3 as the script comes in."""
+
+    def __init__(self, backend=None, output_dir=OUTPUT_DIR, cache_dir=CACHE_DIR):
+        self.backend = backend or default_backend()
+        self.cache_dir = cache_dir
+        self.job_id = uuid.uuid4().hex
+        sweep_outputs(output_dir, cache_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_path = os.path.join(output_dir, f"podcast_{self.job_id}.mp3")
+        open(self.output_path, "wb").close()
+        self.segments = 0
+        self.cache_hits = 0
+
+    def append(self, text):
+        for segment in split_segments(text):
+            mp3_path, cache_hit = render_segment(segment, self.backend, self.cache_dir)
+            try:
+                src = open(mp3_path, "rb")
+            except FileNotFoundError:
+                # Pruned by another job in the meantime
+                mp3_path, cache_hit = render_segment(segment, self.backend, self.cache_dir)
+                src = open(mp3_path, "rb")
+            with src, open(self.output_path, "ab") as dst:
+                shutil.copyfileobj(src, dst)
+            self.segments += 1
+            self.cache_hits += cache_hit
+
+    def render_queue(self, paragraph_queue):
+        """Append each paragraph from the queue until a None arrives; return the MP3 path."""
+        for paragraph in iter(paragraph_queue.get, None):
+            self.append(paragraph)
+        prune_cache(self.cache_dir)
+        return self.output_path
+
+
+def text_to_speech(text, backend=None, output_dir=OUTPUT_DIR):
+    renderer = PodcastRenderer(backend, output_dir)
+    for paragraph in text.split("\n\n"):
+        if paragraph.strip():
+            renderer.append(paragraph)
+    prune_cache(renderer.cache_dir)
+    return renderer.output_path
+
+
+def read_and_remove(path):
+    """Return a finished job's MP3 bytes and delete the file, so served episodes don't pile up."""
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
@@ -0,0 +1,178 @@
+import os
+import re
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import gemini_client
+
+# Long-document mode: pages are grouped into sections of about this many words,
+# and each section becomes one part of the episode.
+SECTION_WORDS = 3000
+
+# "Digest:" / "**Script:**" / "## Script" label lines, whatever markdown the model wraps them in
+_LABEL = r"^[ \t#>*_]*{}[ \t*_]*(?::[ \t*_]*|$)"
+DIGEST_LABEL = re.compile(_LABEL.format("digest"), re.IGNORECASE | re.MULTILINE)
+SCRIPT_LABEL = re.compile(_LABEL.format("script"), re.IGNORECASE | re.MULTILINE)
+
+
+# ----------------- Script Writing -----------------
+
+def iter_sections(pages, max_words=SECTION_WORDS):
+    """Group consecutive pages into sections of roughly max_words words."""
+    section, words = [], 0
+    for page_text in pages:
+        section.append(page_text)
+        words += len(page_text.split())
+        if words >= max_words:
+            yield "".join(section).strip()
+            section, words = [], 0
+    if section:
+        yield "".join(section).strip()
+
+
+def generate_title_and_summary(text):
+    prompt = f"""
+    You're an AI podcast assistant. Read the content below and generate ONLY:
+    1. A podcast title
+    2. A short episode summary
+
+    Respond in this format:
+    Title: <your title>
+    Summary: <your summary>
+
+    CONTENT:
+    {text}
+    """
+    response = gemini_client.generate(prompt).strip()
+
+    # Parse output
+    title, summary = "Untitled Podcast", "No summary available."
+    lines = response.splitlines()
+    for line in lines:
+        if "Title:" in line:
+            title = line.replace("Title:", "").strip()
+        elif "Summary:" in line:
+            summary = line.replace("Summary:", "").strip()
+    return title, summary
+
+
+def podcast_intro(text):
+    # Optional smart intro based on content type
+    if any(keyword in text.lower() for keyword in ["api", "machine learning", "gemini", "ai", "model", "neural"]):
+        return "Welcome to AI Podcast – simplifying the world of technology, one episode at a time."
+    return "Welcome to AI Podcast – where we bring timeless stories and smart ideas to life."
+
+
+PODCAST_OUTRO = "Thanks for listening. Stay inspired with AI Podcast!"
+
+
+def stream_podcast_script(text):
+    """Yield the podcast script one paragraph at a time while Gemini is still writing it."""
+    prompt = (
+        "You're an intelligent podcast narrator. Based ONLY on the content below, create a 3-minute script.\n"
+        "If it's a story, retell it naturally. If it's educational or technical, explain the concepts clearly.\n"
+        "Avoid reading code or special characters. Do NOT add extra topics.\n"
+        "Separate paragraphs with a blank line.\n\n"
+        f"CONTENT:\n{text}"
+    )
+
+    yield podcast_intro(text)
+
+    buffer = ""
+    for chunk in gemini_client.stream(prompt):
+        buffer += chunk
+        # Hand over every finished paragraph, keep the unfinished tail buffered
+        *paragraphs, buffer = buffer.split("\n\n")
+        for paragraph in paragraphs:
+            if paragraph.strip():
+                yield paragraph.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+    yield PODCAST_OUTRO
+
+
+def generate_podcast_script(text):
+    return "\n\n".join(stream_podcast_script(text))
+
+
+def generate_section_script(section, part_number, total_parts):
+    """Map step: return (digest, script) for one section of a long document."""
+    prompt = (
+        f"You're an intelligent podcast narrator recording part {part_number} of a {total_parts}-part episode.\n"
+        "Based ONLY on the content below, narrate this part in about 2 minutes.\n"
+        "If it's a story, retell it naturally. If it's educational or technical, explain the concepts clearly.\n"
+        "Avoid reading code or special characters. Do NOT add extra topics, greetings or sign-offs.\n"
+        "Separate paragraphs with a blank line.\n\n"
+        "Respond in this format:\n"
+        "Digest: <2-3 sentence digest of this part>\n"
+        "Script:\n<your narration>\n\n"
+        f"CONTENT:\n{section}"
+    )
+    return parse_section_response(gemini_client.generate(prompt).strip())
+
+
+def strip_markdown(text):
+    return re.sub(r"\*+|^#+[ \t]*", "", text, flags=re.MULTILINE).strip()
+
+
+def parse_section_response(response):
+    """Split a section reply into (digest, script); raises ValueError if there is no script."""
+    label = SCRIPT_LABEL.search(response)
+    if label:
+        digest, script = response[:label.start()], response[label.end():]
+    elif DIGEST_LABEL.match(response):
+        # No Script label: the narration follows the digest's paragraph
+        digest, _, script = response.partition("\n\n")
+    else:
+        digest, script = "", response
+    digest = strip_markdown(DIGEST_LABEL.sub("", digest, count=1))
+    script = strip_markdown(script)
+    if not script:
+        raise ValueError("Gemini returned no script for this section")
+    return digest or script.split("\n\n")[0], script
+
+
+def iter_section_results(section_futures):
+    """Yield (digest, script) of each section in order, leaving out sections that failed.
+
+    Raises the first error if no section could be scripted at all.
+    """
+    errors = []
+    for future in section_futures:
+        if future.exception() is None:
+            yield future.result()
+        else:
+            errors.append(future.exception())
+    if errors and len(errors) == len(section_futures):
+        raise errors[0]
+
+
+def stream_sectioned_script(section_futures, intro_text):
+    """Reduce step: yield the parts' paragraphs in order as their section scripts finish."""
+    yield podcast_intro(intro_text)
+    for part_number, (_, script) in enumerate(iter_section_results(section_futures), start=1):
+        yield f"Part {part_number}."
+        for paragraph in script.split("\n\n"):
+            if paragraph.strip():
+                yield paragraph.strip()
+    yield PODCAST_OUTRO
+
+
+def generate_title_from_digests(section_futures):
+    digests = [digest for digest, _ in iter_section_results(section_futures)]
+    return generate_title_and_summary("\n\n".join(digests))
+
+
+def produce_script(script_paragraphs, *consumers):
+    """Push every script paragraph to all consumer queues, then close them with None."""
+    paragraphs = []
+    try:
+        for paragraph in script_paragraphs:
+            paragraphs.append(paragraph)
+            for consumer in consumers:
+                consumer.put(paragraph)
+    finally:
+        for consumer in consumers:
+            consumer.put(None)
+    return "\n\n".join(paragraphs)
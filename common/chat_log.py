@@ -0,0 +1,81 @@
+"""Append-only, per-session chat history on disk: one compact JSON line per message."""
+import json
+import os
+import re
+import uuid
+
+SESSIONS_DIR = "chat_sessions"
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+class ChatLog:
+    """Messages are only ever appended; a byte-offset index gives cheap access to any window."""
+
+    def __init__(self, session_id, root=SESSIONS_DIR):
+        # Session ids come from the URL, so never let them pick an arbitrary path
+        if not re.fullmatch(r"[0-9a-f]{32}", session_id or ""):
+            raise ValueError(f"Invalid chat session id: {session_id!r}")
+        self.session_id = session_id
+        self.path = os.path.join(root, f"{session_id}.jsonl")
+        os.makedirs(root, exist_ok=True)
+        self._offsets = []
+        if os.path.exists(self.path):
+            self._index()
+
+    def _index(self):
+        offset = 0
+        with open(self.path, "r+b") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Drop a half-written last line left by a crash
+                    f.truncate(offset)
+                    break
+                self._offsets.append(offset)
+                offset += len(line)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def append(self, role, content, **extra):
+        record = {"role": role, "content": content, **extra}
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with open(self.path, "ab") as f:
+            self._offsets.append(f.tell())
+            f.write(line.encode("utf-8"))
+
+    def read(self, start, stop):
+        """Messages start..stop-1 as dicts, read straight from disk."""
+        start, stop = max(0, start), min(stop, len(self))
+        if start >= stop:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[start])
+            return [json.loads(f.readline()) for _ in range(stop - start)]
+
+    def tail(self, n):
+        return self.read(len(self) - n, len(self))
+
+    def __iter__(self):
+        if not self._offsets:
+            return
+        with open(self.path, "rb") as f:
+            for _ in range(len(self)):
+                yield json.loads(f.readline())
+
+
+def restore_memory(log, memory):
+    """Rebuild a LangChain conversation memory from the log without calling the LLM.
+
+    Only bot messages stored with a `memory` field (the chain's raw answer) were
+    part of the conversation memory; small talk and one-off tasks are skipped.
+    """
+    question = None
+    for record in log:
+        if record["role"] == "user":
+            question = record["content"]
+        elif "memory" in record and question is not None:
+            memory.chat_memory.add_user_message(question)
+            memory.chat_memory.add_ai_message(record["memory"])
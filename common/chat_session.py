@@ -0,0 +1,36 @@
+import streamlit as st
+
+from common.chat_log import ChatLog, new_session_id
+
+# Messages rendered per page of history
+WINDOW = 20
+
+
+def _start(log):
+    st.query_params["session"] = log.session_id
+    st.session_state.chat_log = log
+    st.session_state.chat_window = WINDOW
+
+
+def open_chat_log():
+    """This browser session's ChatLog; ?session=<id> in the URL resumes a saved one."""
+    if "chat_log" not in st.session_state:
+        try:
+            log = ChatLog(st.query_params.get("session"))
+        except ValueError:
+            log = ChatLog(new_session_id())
+        _start(log)
+    return st.session_state.chat_log
+
+
+def reset_chat_log():
+    """Start a fresh session; the old log stays on disk and can still be reopened by its URL."""
+    _start(ChatLog(new_session_id()))
+
+
+def visible_messages(log):
+    """The most recent window of messages, with a button that pages in older ones."""
+    hidden = len(log) - st.session_state.chat_window
+    if hidden > 0 and st.button(f"⬆️ Load {min(WINDOW, hidden)} older messages"):
+        st.session_state.chat_window += WINDOW
+    return log.tail(st.session_state.chat_window)
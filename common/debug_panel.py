@@ -0,0 +1,35 @@
+import os
+
+import streamlit as st
+
+from common import tracing
+
+
+def keep_last_request(request):
+    """Remember request as the session's last one if it did any traced work."""
+    request.finish()
+    if request.spans:
+        st.session_state.last_trace = request
+
+
+def render_debug_panel():
+    """Sidebar breakdown of the last traced request (off unless toggled or TRACE_DEBUG is set).
+
+    Apps call keep_last_request() only on runs that handled a user request, so
+    reruns caused by other widgets (including this toggle) don't replace it.
+    """
+    if not st.sidebar.toggle("🐞 Debug panel", value=bool(os.getenv("TRACE_DEBUG"))):
+        return
+
+    last = st.session_state.get("last_trace")
+    if last is None:
+        st.sidebar.caption("No traced request yet.")
+        return
+
+    rows = last.rows()
+    st.sidebar.subheader("🐞 Last request")
+    st.sidebar.caption(f"{last.name} · {last.wall_ms:.0f} ms total · {len(rows)} stages")
+    st.sidebar.dataframe(rows, hide_index=True, use_container_width=True)
+    st.sidebar.download_button("📥 Spans (JSON lines)", last.to_jsonl(), file_name=f"trace_{last.id}.jsonl")
+    with st.sidebar.expander("📈 Process totals (Prometheus)"):
+        st.code(tracing.prometheus_text(), language="text")
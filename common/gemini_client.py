@@ -0,0 +1,380 @@
+"""Shared Gemini access for every app in this repo.
+
+One cached client per process, a global concurrency limit plus token bucket,
+jittered exponential backoff on quota (429) errors and de-duplication of
+identical in-flight prompts. Set GEMINI_FAKE=1 to run offline on FakeBackend.
+"""
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
+
+from common import tracing
+
+DEFAULT_MODEL = "gemini-2.5-pro"
+DEFAULT_CHAT_MODEL = "gemini-1.5-flash"
+DEFAULT_EMBEDDING_MODEL = "models/embedding-001"
+
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_RPM", "60"))
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+
+# How often a waiting coroutine re-checks for a free slot
+SLOT_POLL_INTERVAL = 0.05
+
+# Texts per embedding request; matches GoogleGenerativeAIEmbeddings' own batch size
+EMBED_BATCH = 100
+
+QUOTA_ERRORS = ("ResourceExhausted", "TooManyRequests")
+
+
+def api_key():
+    return os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+
+
+# ----------------- Rate Limiting -----------------
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """Take a token and return 0, or return the seconds until one is available."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+_semaphore = threading.BoundedSemaphore(MAX_CONCURRENCY)
+_bucket = TokenBucket(REQUESTS_PER_MINUTE / 60, capacity=MAX_CONCURRENCY)
+
+
+@contextmanager
+def slot():
+    """Hold one global request slot for the duration of the block."""
+    _bucket.acquire()
+    with _semaphore:
+        yield
+
+
+@asynccontextmanager
+async def aslot():
+    """slot() for coroutines: waits on the event loop instead of blocking a thread."""
+    await _bucket.acquire_async()
+    # Same semaphore as slot(), so sync and async callers share one limit
+    while not _semaphore.acquire(blocking=False):
+        await asyncio.sleep(SLOT_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        _semaphore.release()
+
+
+def is_quota_error(exc):
+    """True for HTTP 429 / RESOURCE_EXHAUSTED errors, also when wrapped by another exception."""
+    while exc is not None:
+        # google.api_core exceptions, matched by name so the module stays optional
+        if any(cls.__name__ in QUOTA_ERRORS for cls in type(exc).__mro__):
+            return True
+        if getattr(exc, "code", None) == 429 or getattr(exc, "status_code", None) == 429:
+            return True
+        exc = exc.__cause__
+    return False
+
+
+def _backoff_delay(attempt):
+    # Full jitter keeps many waiting sessions from retrying in lockstep
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def _backoff(attempt):
+    time.sleep(_backoff_delay(attempt))
+
+
+async def _backoff_async(attempt):
+    await asyncio.sleep(_backoff_delay(attempt))
+
+
+def call(fn, *args, **kwargs):
+    """Run fn (any Gemini-backed call) inside a slot, retrying quota errors with backoff."""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            with slot():
+                return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == MAX_RETRIES or not is_quota_error(e):
+                raise
+            _backoff(attempt)
+
+
+async def acall(fn, *args, **kwargs):
+    """call() for coroutines: fn runs in a worker thread only once it holds a slot."""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            async with aslot():
+                return await asyncio.to_thread(fn, *args, **kwargs)
+        except Exception as e:
+            if attempt == MAX_RETRIES or not is_quota_error(e):
+                raise
+            await _backoff_async(attempt)
+
+
+# ----------------- Backends -----------------
+
+class GeminiBackend:
+    def generate(self, prompt, model_name):
+        response = get_model(model_name).generate_content(prompt)
+        usage = response.usage_metadata
+        tracing.annotate(tokens_in=usage.prompt_token_count, tokens_out=usage.candidates_token_count)
+        return response.text
+
+    def stream(self, prompt, model_name):
+        usage = None
+        for chunk in get_model(model_name).generate_content(prompt, stream=True):
+            # Running totals; the final chunk carries the counts for the whole response
+            usage = chunk.usage_metadata or usage
+            if chunk.text:
+                yield chunk.text
+        if usage:
+            tracing.annotate(tokens_in=usage.prompt_token_count, tokens_out=usage.candidates_token_count)
+
+
+class FakeBackend:
+    """Offline stand-in for tests: deterministic answers, no network or API key needed."""
+
+    def __init__(self, responder=None, latency=0.0):
+        self.responder = responder or (lambda prompt: f"[fake] {prompt.strip()[:200]}")
+        self.latency = latency
+        self.calls = 0
+
+    def generate(self, prompt, model_name):
+        self.calls += 1
+        time.sleep(self.latency)
+        text = self.responder(prompt)
+        tracing.annotate(tokens_in=len(prompt.split()), tokens_out=len(text.split()))
+        return text
+
+    def stream(self, prompt, model_name):
+        for word in self.generate(prompt, model_name).split(" "):
+            yield word + " "
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = FakeBackend() if os.getenv("GEMINI_FAKE") else GeminiBackend()
+    return _backend
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def is_fake():
+    return isinstance(get_backend(), FakeBackend)
+
+
+# ----------------- Cached Clients -----------------
+
+# LangChain chains and vector stores make several API requests per call (a
+# ConversationalRetrievalChain turn is two chat calls plus a query embedding),
+# so the limits are applied per underlying request by these subclasses rather
+# than around the whole chain.
+
+def _rate_limited_chat(base):
+    class RateLimitedChatModel(base):
+        def _generate(self, *args, **kwargs):
+            return call(super()._generate, *args, **kwargs)
+
+    return RateLimitedChatModel
+
+
+def _rate_limited_embeddings(base):
+    class RateLimitedEmbeddings(base):
+        def embed_documents(self, texts, *args, **kwargs):
+            vectors = []
+            for start in range(0, len(texts), EMBED_BATCH):
+                batch = texts[start:start + EMBED_BATCH]
+                vectors.extend(call(super().embed_documents, batch, *args, **kwargs))
+            return vectors
+
+        def embed_query(self, text, *args, **kwargs):
+            return call(super().embed_query, text, *args, **kwargs)
+
+    return RateLimitedEmbeddings
+
+
+@lru_cache(maxsize=None)
+def _genai():
+    import google.generativeai as genai
+
+    genai.configure(api_key=api_key())
+    return genai
+
+
+@lru_cache(maxsize=None)
+def get_model(model_name=DEFAULT_MODEL):
+    return _genai().GenerativeModel(model_name)
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(model_name=DEFAULT_CHAT_MODEL, temperature=0.3):
+    """LangChain chat model shared across reruns and sessions; every request takes a slot."""
+    if is_fake():
+        from langchain_core.language_models import FakeListChatModel
+
+        return _rate_limited_chat(FakeListChatModel)(responses=["[fake] This is an offline answer."])
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    # Retries are handled by call(), so LangChain makes a single attempt
+    return _rate_limited_chat(ChatGoogleGenerativeAI)(
+        model=model_name, temperature=temperature, google_api_key=api_key(), max_retries=1
+    )
+
+
+@lru_cache(maxsize=None)
+def get_embeddings(model_name=DEFAULT_EMBEDDING_MODEL):
+    if is_fake():
+        from langchain_community.embeddings import FakeEmbeddings
+
+        return _rate_limited_embeddings(FakeEmbeddings)(size=768)
+
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    return _rate_limited_embeddings(GoogleGenerativeAIEmbeddings)(model=model_name, google_api_key=api_key())
+
+
+# ----------------- Text Generation -----------------
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def _join_in_flight(key):
+    """Return (future, owner); the owner makes the request, everyone else waits on future."""
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        if future is not None:
+            return future, False
+        future = _in_flight[key] = Future()
+        # Running futures can't be cancelled, so one waiter giving up never fails the others
+        future.set_running_or_notify_cancel()
+        return future, True
+
+
+def _settle_in_flight(key, future, text=None, error=None):
+    with _in_flight_lock:
+        del _in_flight[key]
+    if error is None:
+        future.set_result(text)
+    else:
+        future.set_exception(error)
+
+
+def generate(prompt, model_name=DEFAULT_MODEL):
+    """Return Gemini's text for prompt; identical concurrent prompts share one request."""
+    key = hashlib.sha256(f"{model_name}\n{prompt}".encode("utf-8")).hexdigest()
+    with tracing.trace("llm.generate", bytes_in=len(prompt.encode("utf-8"))) as span:
+        future, owner = _join_in_flight(key)
+        if not owner:
+            span.cache_hit = True
+            text = future.result()
+        else:
+            try:
+                text = call(get_backend().generate, prompt, model_name)
+            except BaseException as e:
+                _settle_in_flight(key, future, error=e)
+                raise
+            _settle_in_flight(key, future, text)
+        span.bytes_out = len(text.encode("utf-8"))
+        return text
+
+
+async def agenerate(prompt, model_name=DEFAULT_MODEL):
+    """generate() for coroutines, sharing its limits and in-flight de-duplication."""
+    key = hashlib.sha256(f"{model_name}\n{prompt}".encode("utf-8")).hexdigest()
+    with tracing.trace("llm.generate", bytes_in=len(prompt.encode("utf-8"))) as span:
+        future, owner = _join_in_flight(key)
+        if not owner:
+            span.cache_hit = True
+            text = await asyncio.wrap_future(future)
+        else:
+            try:
+                text = await acall(get_backend().generate, prompt, model_name)
+            except BaseException as e:
+                _settle_in_flight(key, future, error=e)
+                raise
+            _settle_in_flight(key, future, text)
+        span.bytes_out = len(text.encode("utf-8"))
+        return text
+
+
+def stream(prompt, model_name=DEFAULT_MODEL):
+    """Yield Gemini's text chunk by chunk; quota errors are retried until the first chunk arrives."""
+    # Not a with-block: the generator may be resumed from another context
+    span = tracing.Span("llm.stream", bytes_in=len(prompt.encode("utf-8")))
+    request = tracing.current_request()
+    try:
+        for attempt in range(MAX_RETRIES + 1):
+            started = False
+            try:
+                _bucket.acquire()
+                chunks = get_backend().stream(prompt, model_name)
+                try:
+                    while True:
+                        # A slot is held only while a chunk is fetched, never while the
+                        # consumer has control, so a slow or abandoned reader can't keep it
+                        with _semaphore, tracing.current(span):
+                            chunk = next(chunks, None)
+                        if chunk is None:
+                            break
+                        started = True
+                        span.bytes_out += len(chunk.encode("utf-8"))
+                        yield chunk
+                finally:
+                    chunks.close()
+                return
+            except Exception as e:
+                if started or attempt == MAX_RETRIES or not is_quota_error(e):
+                    span.error = type(e).__name__
+                    raise
+                _backoff(attempt)
+    finally:
+        tracing.finish(span, request)
@@ -0,0 +1,256 @@
+"""Lightweight per-stage tracing.
+
+    with tracing.trace("embed", bytes_in=size) as span:
+        ...
+        span.tokens_out = 42
+
+    @tracing.trace("faq.tfidf")
+    def faq_response(query): ...
+
+Spans land in the current request (see begin()) and in process-wide per-stage
+totals exported by prometheus_text(). Set TRACE_JSONL to a file path to also
+append every finished span there as one JSON line.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+JSONL_PATH = os.getenv("TRACE_JSONL")
+
+COUNTERS = ("calls", "wall_ms", "cpu_ms", "bytes_in", "bytes_out", "tokens_in", "tokens_out", "cache_hits", "errors")
+
+
+class Span:
+    __slots__ = ("stage", "wall_ms", "cpu_ms", "bytes_in", "bytes_out", "tokens_in", "tokens_out",
+                 "cache_hit", "error", "_wall0", "_cpu0")
+
+    def __init__(self, stage, bytes_in=0, bytes_out=0, tokens_in=0, tokens_out=0, cache_hit=False):
+        self.stage = stage
+        self.wall_ms = self.cpu_ms = 0.0
+        self.bytes_in, self.bytes_out = bytes_in, bytes_out
+        self.tokens_in, self.tokens_out = tokens_in, tokens_out
+        self.cache_hit = cache_hit
+        self.error = None
+        self._wall0 = time.perf_counter()
+        # CPU time of the calling thread only, so concurrent stages don't inflate each other
+        self._cpu0 = time.thread_time()
+
+    def as_dict(self):
+        return {
+            "stage": self.stage,
+            "wall_ms": round(self.wall_ms, 3),
+            "cpu_ms": round(self.cpu_ms, 3),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "cache_hit": self.cache_hit,
+            "error": self.error,
+        }
+
+
+class Request:
+    """All spans recorded for one user interaction."""
+
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.started = time.time()
+        self.wall_ms = 0.0
+        self.spans = []
+        self._wall0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self):
+        self.wall_ms = (time.perf_counter() - self._wall0) * 1000
+
+    def rows(self):
+        with self._lock:
+            return [span.as_dict() for span in self.spans]
+
+    def to_jsonl(self):
+        return "".join(json.dumps(dict(row, request=self.id, name=self.name)) + "\n" for row in self.rows())
+
+
+_current_request = contextvars.ContextVar("trace_request", default=None)
+_current_span = contextvars.ContextVar("trace_span", default=None)
+
+_totals = {}
+_totals_lock = threading.Lock()
+_jsonl_file = None
+
+
+def begin(name):
+    """Start a new request; spans recorded in this context (and bind()ed threads) join it."""
+    request = Request(name)
+    _current_request.set(request)
+    return request
+
+
+def current_request():
+    return _current_request.get()
+
+
+def bind(fn):
+    """Wrap fn so it runs in the caller's tracing context, e.g. inside a worker thread."""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+def finish(span, request=None):
+    """Stop span's clocks and record it; use this for spans that can't be a with-block."""
+    span.wall_ms = (time.perf_counter() - span._wall0) * 1000
+    span.cpu_ms = (time.thread_time() - span._cpu0) * 1000
+    request = request or _current_request.get()
+    if request is not None:
+        request.add(span)
+
+    with _totals_lock:
+        totals = _totals.setdefault(span.stage, dict.fromkeys(COUNTERS, 0))
+        totals["calls"] += 1
+        totals["wall_ms"] += span.wall_ms
+        totals["cpu_ms"] += span.cpu_ms
+        totals["bytes_in"] += span.bytes_in
+        totals["bytes_out"] += span.bytes_out
+        totals["tokens_in"] += span.tokens_in
+        totals["tokens_out"] += span.tokens_out
+        totals["cache_hits"] += bool(span.cache_hit)
+        totals["errors"] += span.error is not None
+
+        if JSONL_PATH:
+            global _jsonl_file
+            if _jsonl_file is None:
+                _jsonl_file = open(JSONL_PATH, "a", buffering=1, encoding="utf-8")
+            row = dict(span.as_dict(), request=request.id if request else None, ts=time.time())
+            _jsonl_file.write(json.dumps(row) + "\n")
+
+
+@contextmanager
+def trace(stage, **fields):
+    """Time the block (or decorated function) as one span of the given stage."""
+    span = Span(stage, **fields)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        finish(span)
+
+
+@contextmanager
+def current(span):
+    """Make an already-open span the target of annotate() for the block."""
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+def annotate(**fields):
+    """Add counters (bytes_out=..., tokens_in=..., cache_hit=...) to the innermost open span."""
+    span = _current_span.get()
+    if span is None:
+        return
+    for name, value in fields.items():
+        setattr(span, name, value)
+
+
+def totals():
+    with _totals_lock:
+        return {stage: dict(counters) for stage, counters in _totals.items()}
+
+
+def prometheus_text(prefix="app_stage"):
+    """Per-stage totals in the Prometheus text exposition format."""
+    metrics = [
+        ("calls", "calls_total", "Finished spans.", 1),
+        ("wall_ms", "wall_seconds_total", "Wall-clock time spent.", 1000),
+        ("cpu_ms", "cpu_seconds_total", "CPU time spent by the tracing thread.", 1000),
+        ("bytes_in", "bytes_in_total", "Bytes consumed.", 1),
+        ("bytes_out", "bytes_out_total", "Bytes produced.", 1),
+        ("tokens_in", "tokens_in_total", "Model tokens sent.", 1),
+        ("tokens_out", "tokens_out_total", "Model tokens received.", 1),
+        ("cache_hits", "cache_hits_total", "Spans served from a cache.", 1),
+        ("errors", "errors_total", "Spans that raised.", 1),
+    ]
+    snapshot = totals()
+    lines = []
+    for key, name, help_text, scale in metrics:
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} counter")
+        for stage, counters in sorted(snapshot.items()):
+            label = stage.replace("\\", "\\\\").replace('"', '\\"')
+            value = counters[key] / scale if scale != 1 else counters[key]
+            # Exact integers and round-trippable floats, so large counters keep every digit
+            value = str(value) if isinstance(value, int) else repr(float(value))
+            lines.append(f'{prefix}_{name}{{stage="{label}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def langchain_handler():
+    """LangChain callback handler that records retriever and LLM calls as spans."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TracingHandler(BaseCallbackHandler):
+        def __init__(self):
+            self.request = _current_request.get()
+            self._open = {}
+
+        def _start(self, run_id, stage, **fields):
+            self._open[run_id] = Span(stage, **fields)
+
+        def _end(self, run_id, error=None, **fields):
+            span = self._open.pop(run_id, None)
+            if span is None:
+                return
+            for name, value in fields.items():
+                setattr(span, name, value)
+            span.error = error
+            finish(span, self.request)
+
+        def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+            self._start(run_id, "retrieval", bytes_in=len(query.encode("utf-8")))
+
+        def on_retriever_end(self, documents, *, run_id, **kwargs):
+            size = sum(len(doc.page_content.encode("utf-8")) for doc in documents)
+            self._end(run_id, bytes_out=size)
+
+        def on_retriever_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error=type(error).__name__)
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._start(run_id, "llm.generate", bytes_in=sum(len(p.encode("utf-8")) for p in prompts))
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            size = sum(len(str(m.content).encode("utf-8")) for batch in messages for m in batch)
+            self._start(run_id, "llm.generate", bytes_in=size)
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            fields = {"bytes_out": 0, "tokens_in": 0, "tokens_out": 0}
+            for generation in (response.generations[0] if response.generations else []):
+                fields["bytes_out"] += len(generation.text.encode("utf-8"))
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                fields["tokens_in"] += usage.get("input_tokens", 0)
+                fields["tokens_out"] += usage.get("output_tokens", 0)
+            self._end(run_id, **fields)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error=type(error).__name__)
+
+    return TracingHandler()
@@ -0,0 +1,64 @@
+import pytest
+
+from common.chat_log import ChatLog, new_session_id, restore_memory
+
+
+@pytest.fixture
+def log(tmp_path):
+    return ChatLog(new_session_id(), root=str(tmp_path))
+
+
+def test_half_written_last_line_is_dropped_on_reopen(log, tmp_path):
+    log.append("user", "hello")
+    log.append("bot", "hi there")
+    with open(log.path, "ab") as f:
+        f.write(b'{"role":"user","content":"cut of')
+
+    reopened = ChatLog(log.session_id, root=str(tmp_path))
+    assert len(reopened) == 2
+    reopened.append("user", "next")
+    assert [m["content"] for m in reopened] == ["hello", "hi there", "next"]
+
+
+def test_read_and_tail_windows_are_clamped(log):
+    for i in range(5):
+        log.append("user", f"m{i}", extra=i)
+
+    assert [m["content"] for m in log.read(1, 3)] == ["m1", "m2"]
+    assert [m["content"] for m in log.read(-10, 2)] == ["m0", "m1"]
+    assert [m["content"] for m in log.read(3, 99)] == ["m3", "m4"]
+    assert log.read(4, 2) == []
+    assert [m["content"] for m in log.tail(2)] == ["m3", "m4"]
+    assert len(log.tail(50)) == 5
+    assert log.read(0, 1)[0]["extra"] == 0
+
+
+@pytest.mark.parametrize("session_id", [None, "", "../../etc/passwd", "A" * 32, "0" * 31, "0" * 32 + "/x"])
+def test_session_ids_are_validated(session_id, tmp_path):
+    with pytest.raises(ValueError):
+        ChatLog(session_id, root=str(tmp_path))
+
+
+class Memory:
+    def __init__(self):
+        self.messages = []
+        self.chat_memory = self
+
+    def add_user_message(self, text):
+        self.messages.append(("user", text))
+
+    def add_ai_message(self, text):
+        self.messages.append(("ai", text))
+
+
+def test_restore_memory_replays_only_remembered_answers(log):
+    log.append("user", "hi")
+    log.append("bot", "Hello! How can I help?")
+    log.append("user", "What is chapter 2 about?")
+    log.append("bot", "**Answer:** Trains.", memory="Trains.")
+    log.append("user", "Summarize the PDF")
+    log.append("bot", "A summary.")
+
+    memory = Memory()
+    restore_memory(log, memory)
+    assert memory.messages == [("user", "What is chapter 2 about?"), ("ai", "Trains.")]
@@ -0,0 +1,267 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from common import gemini_client, tracing
+
+
+class QuotaError(Exception):
+    code = 429
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def fake_backend(monkeypatch):
+    backend = gemini_client.FakeBackend()
+    monkeypatch.setattr(gemini_client, "_backend", backend)
+    monkeypatch.setattr(gemini_client, "_bucket", gemini_client.TokenBucket(rate=1000, capacity=1000))
+    monkeypatch.setattr(gemini_client, "MAX_RETRIES", 3)
+    backoffs = []
+    monkeypatch.setattr(gemini_client, "_backoff", backoffs.append)
+    backend.backoffs = backoffs
+    return backend
+
+
+def test_token_bucket_paces_requests_after_burst():
+    bucket = gemini_client.TokenBucket(rate=50, capacity=2)
+    started = time.monotonic()
+    for _ in range(7):
+        bucket.acquire()
+    # 2 tokens are free, the other 5 arrive at 50 per second
+    assert time.monotonic() - started >= 0.09
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (ResourceExhausted("slow down"), True),
+    (QuotaError("too many"), True),
+    (ValueError("listening on port 4290"), False),
+    (RuntimeError("quota exceeded"), False),
+])
+def test_is_quota_error(exc, expected):
+    assert gemini_client.is_quota_error(exc) is expected
+
+
+def test_is_quota_error_follows_cause():
+    try:
+        try:
+            raise ResourceExhausted()
+        except ResourceExhausted as e:
+            raise RuntimeError("chain failed") from e
+    except RuntimeError as wrapped:
+        assert gemini_client.is_quota_error(wrapped)
+
+
+def test_call_retries_quota_errors_then_succeeds(fake_backend):
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise QuotaError()
+        return "ok"
+
+    assert gemini_client.call(flaky) == "ok"
+    assert len(attempts) == 3
+    assert fake_backend.backoffs == [0, 1]
+
+
+def test_call_gives_up_after_max_retries(fake_backend):
+    def always_quota():
+        raise QuotaError()
+
+    with pytest.raises(QuotaError):
+        gemini_client.call(always_quota)
+    assert fake_backend.backoffs == [0, 1, 2]
+
+
+def test_call_does_not_retry_other_errors(fake_backend):
+    def broken():
+        raise ValueError("bad prompt")
+
+    with pytest.raises(ValueError):
+        gemini_client.call(broken)
+    assert fake_backend.backoffs == []
+
+
+def run_concurrently(fn, count):
+    results = [None] * count
+
+    def worker(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_identical_in_flight_prompts_share_one_request(fake_backend):
+    fake_backend.latency = 0.2
+    results = run_concurrently(lambda: gemini_client.generate("same prompt"), 5)
+    assert results == ["[fake] same prompt"] * 5
+    assert fake_backend.calls == 1
+
+
+def test_in_flight_errors_are_shared_and_not_cached(fake_backend):
+    def failing(prompt):
+        time.sleep(0.2)
+        raise ValueError("boom")
+
+    fake_backend.responder = failing
+    results = run_concurrently(lambda: gemini_client.generate("same prompt"), 3)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert fake_backend.calls == 1
+
+    fake_backend.responder = lambda prompt: "recovered"
+    assert gemini_client.generate("same prompt") == "recovered"
+
+
+def test_concurrent_agenerate_respects_max_concurrency_and_dedups(monkeypatch, fake_backend):
+    monkeypatch.setattr(gemini_client, "_semaphore", threading.BoundedSemaphore(2))
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def responder(prompt):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return f"answer {prompt}"
+
+    fake_backend.responder = responder
+    prompts = [f"p{i}" for i in range(6)] + ["p0"] * 3
+
+    async def main():
+        return await asyncio.gather(*(gemini_client.agenerate(p) for p in prompts))
+
+    assert asyncio.run(main()) == [f"answer {p}" for p in prompts]
+    assert peak[0] == 2
+    assert fake_backend.calls == 6
+
+
+def test_waiting_agenerate_calls_do_not_hold_worker_threads(monkeypatch, fake_backend):
+    monkeypatch.setattr(gemini_client, "_semaphore", threading.BoundedSemaphore(2))
+    fake_backend.latency = 0.3
+
+    async def main():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=3))
+        requests = [asyncio.create_task(gemini_client.agenerate(f"p{i}")) for i in range(8)]
+        await asyncio.sleep(0.05)
+        started = time.monotonic()
+        # Two workers run requests; the third stays free for unrelated to_thread work
+        await asyncio.to_thread(lambda: None)
+        waited = time.monotonic() - started
+        await asyncio.gather(*requests)
+        return waited
+
+    assert asyncio.run(main()) < 0.2
+
+
+class FlakyStreamBackend:
+    def __init__(self, fail_before_first_chunk, fail_after_first_chunk):
+        self.fail_before = fail_before_first_chunk
+        self.fail_after = fail_after_first_chunk
+        self.attempts = 0
+
+    def stream(self, prompt, model_name):
+        self.attempts += 1
+        if self.attempts <= self.fail_before:
+            raise QuotaError()
+        yield "first "
+        if self.fail_after:
+            raise QuotaError()
+        yield "second"
+
+
+def test_stream_retries_before_first_chunk(monkeypatch, fake_backend):
+    backend = FlakyStreamBackend(fail_before_first_chunk=2, fail_after_first_chunk=False)
+    monkeypatch.setattr(gemini_client, "_backend", backend)
+    assert "".join(gemini_client.stream("prompt")) == "first second"
+    assert backend.attempts == 3
+    assert fake_backend.backoffs == [0, 1]
+
+
+def test_stream_does_not_retry_after_first_chunk(monkeypatch, fake_backend):
+    backend = FlakyStreamBackend(fail_before_first_chunk=0, fail_after_first_chunk=True)
+    monkeypatch.setattr(gemini_client, "_backend", backend)
+    chunks = []
+    with pytest.raises(QuotaError):
+        for chunk in gemini_client.stream("prompt"):
+            chunks.append(chunk)
+    assert chunks == ["first "]
+    assert backend.attempts == 1
+    assert fake_backend.backoffs == []
+
+
+def test_stream_releases_its_slot_while_the_consumer_has_control(monkeypatch):
+    semaphore = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(gemini_client, "_semaphore", semaphore)
+    chunks = gemini_client.stream("one two three")
+    assert next(chunks) == "[fake] "
+    # The slot is free while this stream is paused mid-way
+    assert semaphore.acquire(timeout=1)
+    semaphore.release()
+    assert "".join(chunks) == "one two three "
+
+
+def test_stream_records_token_usage_on_its_span():
+    request = tracing.begin("test")
+    assert "".join(gemini_client.stream("count these four")) == "[fake] count these four "
+    [row] = [row for row in request.rows() if row["stage"] == "llm.stream"]
+    assert (row["tokens_in"], row["tokens_out"]) == (3, 4)
+
+
+@pytest.fixture
+def slots(monkeypatch):
+    taken = []
+    original = gemini_client.slot
+
+    def counting_slot():
+        taken.append(1)
+        return original()
+
+    monkeypatch.setattr(gemini_client, "slot", counting_slot)
+    return taken
+
+
+def test_chat_wrapper_takes_a_slot_per_model_request(slots):
+    class Chat:
+        def _generate(self, messages):
+            return f"reply to {messages}"
+
+    chat = gemini_client._rate_limited_chat(Chat)()
+    assert [chat._generate("a"), chat._generate("b")] == ["reply to a", "reply to b"]
+    assert len(slots) == 2
+
+
+def test_embeddings_wrapper_takes_a_slot_per_batch(slots, monkeypatch):
+    monkeypatch.setattr(gemini_client, "EMBED_BATCH", 100)
+    batches = []
+
+    class Embeddings:
+        def embed_documents(self, texts):
+            batches.append(len(texts))
+            return [[float(len(text))] for text in texts]
+
+        def embed_query(self, text):
+            return [float(len(text))]
+
+    embeddings = gemini_client._rate_limited_embeddings(Embeddings)()
+    vectors = embeddings.embed_documents(["x" * i for i in range(250)])
+    embeddings.embed_query("query")
+    assert batches == [100, 100, 50]
+    assert vectors[249] == [249.0]
+    assert len(slots) == 4
@@ -0,0 +1,77 @@
+import os
+import queue
+import time
+import wave
+
+import pytest
+
+import podcast_audio
+
+
+def test_split_segments_groups_sentences_up_to_limit():
+    text = "One two three. Four five six! Seven eight nine? Ten."
+    assert podcast_audio.split_segments(text, max_chars=30) == [
+        "One two three. Four five six!",
+        "Seven eight nine? Ten.",
+    ]
+    assert podcast_audio.split_segments("   ") == []
+
+
+def test_silent_backend_writes_silence_proportional_to_words(tmp_path):
+    path = tmp_path / "segment.wav"
+    podcast_audio.SilentBackend(seconds_per_word=0.5, frame_rate=8000).synthesize("four words right here", str(path))
+    with wave.open(str(path)) as wav:
+        assert wav.getframerate() == 8000
+        assert wav.getnframes() == 4 * 0.5 * 8000
+
+
+def test_prune_cache_drops_least_recently_used(tmp_path):
+    now = time.time()
+    for age, name in enumerate(["new", "middle", "old"]):
+        path = tmp_path / f"{name}.mp3"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (now - age * 60, now - age * 60))
+
+    podcast_audio.prune_cache(str(tmp_path), max_bytes=200)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["middle.mp3", "new.mp3"]
+
+
+def test_sweep_outputs_removes_only_stale_job_files(tmp_path):
+    output_dir, cache_dir = tmp_path, tmp_path / "segments"
+    cache_dir.mkdir()
+    stale = [output_dir / "podcast_old.mp3", cache_dir / "tmpabc.wav", cache_dir / "tmpabc.part"]
+    kept = [output_dir / "podcast_new.mp3", cache_dir / "cached.mp3"]
+    for path in stale + kept:
+        path.write_bytes(b"x")
+    old = time.time() - 7200
+    for path in stale + [cache_dir / "cached.mp3"]:
+        os.utime(path, (old, old))
+
+    podcast_audio.sweep_outputs(str(output_dir), str(cache_dir), max_age=3600)
+    assert not any(path.exists() for path in stale)
+    assert all(path.exists() for path in kept)
+
+
+def test_read_and_remove_deletes_served_file(tmp_path):
+    path = tmp_path / "podcast_job.mp3"
+    path.write_bytes(b"mp3 bytes")
+    assert podcast_audio.read_and_remove(str(path)) == b"mp3 bytes"
+    assert not path.exists()
+
+
+def test_renderer_appends_segments_and_reuses_cache(tmp_path):
+    pytest.importorskip("pydub")
+    output_dir, cache_dir = str(tmp_path), str(tmp_path / "segments")
+    paragraphs = queue.Queue()
+    for paragraph in ["Hello there. This is a test.", "Second paragraph.", None]:
+        paragraphs.put(paragraph)
+
+    first = podcast_audio.PodcastRenderer(podcast_audio.SilentBackend(), output_dir, cache_dir)
+    path = first.render_queue(paragraphs)
+    assert os.path.getsize(path) > 0
+    assert first.cache_hits == 0
+
+    second = podcast_audio.PodcastRenderer(podcast_audio.SilentBackend(), output_dir, cache_dir)
+    second.append("Second paragraph.")
+    assert second.cache_hits == 1
+    assert second.output_path != path
@@ -0,0 +1,127 @@
+import queue
+from concurrent.futures import Future
+
+import pytest
+
+from common import gemini_client
+import podcast_script
+
+
+class ChunkBackend:
+    """Streams a fixed list of chunks, so tests control where the boundaries fall."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def stream(self, prompt, model_name):
+        yield from self.chunks
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(gemini_client, "_bucket", gemini_client.TokenBucket(rate=1000, capacity=1000))
+
+    def use(backend):
+        monkeypatch.setattr(gemini_client, "_backend", backend)
+        return backend
+
+    return use
+
+
+def test_stream_podcast_script_buffers_paragraphs_across_chunk_boundaries(backend):
+    backend(ChunkBackend(["First para", "graph.\n", "\nSecond one.\n\n", "\n\n", "Third", " and last.\n"]))
+    paragraphs = list(podcast_script.stream_podcast_script("a story"))
+    assert paragraphs[1:-1] == ["First paragraph.", "Second one.", "Third and last."]
+    assert paragraphs[0] == podcast_script.podcast_intro("a story")
+    assert paragraphs[-1] == podcast_script.PODCAST_OUTRO
+
+
+def test_gemini_errors_are_raised_not_narrated(backend):
+    def failing(prompt):
+        raise RuntimeError("net down")
+
+    backend(gemini_client.FakeBackend(responder=failing))
+    script = podcast_script.stream_podcast_script("story")
+    assert next(script) == podcast_script.podcast_intro("story")
+    with pytest.raises(RuntimeError, match="net down"):
+        next(script)
+    with pytest.raises(RuntimeError, match="net down"):
+        podcast_script.generate_title_and_summary("story")
+
+
+def test_produce_script_feeds_every_consumer_and_closes_them():
+    first, second = queue.Queue(), queue.Queue()
+    assert podcast_script.produce_script(iter(["a", "b"]), first, second) == "a\n\nb"
+    for consumer in (first, second):
+        assert list(iter(consumer.get, None)) == ["a", "b"]
+
+
+def test_produce_script_closes_consumers_when_the_script_fails():
+    def failing_script():
+        yield "a"
+        raise RuntimeError("net down")
+
+    consumer = queue.Queue()
+    with pytest.raises(RuntimeError):
+        podcast_script.produce_script(failing_script(), consumer)
+    assert list(iter(consumer.get, None)) == ["a"]
+
+
+def test_iter_sections_groups_pages_by_word_count():
+    pages = ["one two\n", "three four five\n", "six\n", "seven eight nine ten\n", "eleven\n"]
+    assert list(podcast_script.iter_sections(pages, max_words=4)) == [
+        "one two\nthree four five",
+        "six\nseven eight nine ten",
+        "eleven",
+    ]
+    assert list(podcast_script.iter_sections([], max_words=4)) == []
+
+
+@pytest.mark.parametrize("response", [
+    "Digest: A short digest.\nScript:\nFirst paragraph.\n\nSecond paragraph.",
+    "**Digest:** A short digest.\n**Script:**\nFirst paragraph.\n\nSecond paragraph.",
+    "**Digest**: A short digest.\n\n**Script**:\n\nFirst paragraph.\n\nSecond paragraph.",
+    "## Digest\nA short digest.\n\n## Script\nFirst paragraph.\n\nSecond paragraph.",
+    "digest: A short digest.\n\nFirst paragraph.\n\nSecond paragraph.",
+])
+def test_parse_section_response_tolerates_markdown_labels(response):
+    assert podcast_script.parse_section_response(response) == (
+        "A short digest.", "First paragraph.\n\nSecond paragraph."
+    )
+
+
+def test_parse_section_response_without_labels():
+    digest, script = podcast_script.parse_section_response("Scripted tests are **great**.\n\nMore.")
+    assert (digest, script) == ("Scripted tests are great.", "Scripted tests are great.\n\nMore.")
+    with pytest.raises(ValueError):
+        podcast_script.parse_section_response("**Digest:** Only a digest.\n**Script:**")
+
+
+def finished(result=None, error=None):
+    future = Future()
+    if error:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+    return future
+
+
+def test_failed_sections_are_left_out_of_script_and_digests(backend):
+    prompts = []
+    backend(gemini_client.FakeBackend(responder=lambda prompt: prompts.append(prompt) or "Title: T\nSummary: S"))
+    futures = [
+        finished(("Digest one.", "Part one text.")),
+        finished(error=RuntimeError("net down")),
+        finished(("Digest three.", "Part three text.")),
+    ]
+    paragraphs = list(podcast_script.stream_sectioned_script(futures, "story"))
+    assert paragraphs[1:-1] == ["Part 1.", "Part one text.", "Part 2.", "Part three text."]
+    assert podcast_script.generate_title_from_digests(futures) == ("T", "S")
+    assert "Digest one.\n\nDigest three." in prompts[0]
+    assert "net down" not in prompts[0]
+
+
+def test_script_fails_when_every_section_failed():
+    futures = [finished(error=RuntimeError("net down")), finished(error=ValueError("no script"))]
+    with pytest.raises(RuntimeError, match="net down"):
+        list(podcast_script.stream_sectioned_script(futures, "story"))
@@ -0,0 +1,31 @@
+from common import tracing
+
+
+def metric(text, name, stage):
+    prefix = f'{name}{{stage="{stage}"}} '
+    return next(line[len(prefix):] for line in text.splitlines() if line.startswith(prefix))
+
+
+def test_prometheus_counters_keep_full_precision():
+    span = tracing.Span("test.precision", bytes_in=123456789, tokens_out=98765432101)
+    tracing.finish(span)
+    text = tracing.prometheus_text()
+    assert metric(text, "app_stage_bytes_in_total", "test.precision") == "123456789"
+    assert metric(text, "app_stage_tokens_out_total", "test.precision") == "98765432101"
+    seconds = metric(text, "app_stage_wall_seconds_total", "test.precision")
+    assert float(seconds) == tracing.totals()["test.precision"]["wall_ms"] / 1000
+
+
+def test_spans_join_the_current_request_and_decorator_form():
+    request = tracing.begin("test")
+
+    @tracing.trace("test.decorated")
+    def work():
+        tracing.annotate(cache_hit=True)
+
+    work()
+    with tracing.trace("test.block", bytes_in=3) as span:
+        span.bytes_out = 5
+
+    stages = [(row["stage"], row["cache_hit"], row["bytes_out"]) for row in request.rows()]
+    assert stages == [("test.decorated", True, 0), ("test.block", False, 5)]